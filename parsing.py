@@ -1,5 +1,28 @@
+import functools
+import itertools
+import operator
 import re
 
+# Character runs scanned in one regex match, rather than one parser call per character.
+_RE_WS = re.compile(r'\s*')
+_RE_NONWS = re.compile(r'\S+')
+_RE_INTEGER = re.compile(r'-?\d+')
+_RE_DECIMAL = re.compile(r'-?\d+(\.\d+)?')
+_RE_LINE = re.compile(r'([^\n]*)\n?')
+# A backslash escapes the quote right after it and is kept as-is anywhere else, so there is only one way for either of these to match.
+_RE_QUOTED = re.compile(r'"([^"\\]*(?:\\(?:"|(?!"))[^"\\]*)*)"')
+_RE_SINGLE_QUOTED = re.compile(r"'([^'\\]*(?:\\(?:'|(?!'))[^'\\]*)*)'")
+# A regex that starts with ^, possibly after inline flags such as (?i).
+_RE_LEADING_CARET = re.compile(r'((?:\(\?[a-zA-Z]+\))*)\^')
+
+# Whether combinators memoize the parsers they build; see enablePackrat().
+_packratEnabled = False
+# The input string and packrat memos of the parse running right now, or None between parses; see _parse().
+_packratParse = None
+
+# Exceptions that a result processor may raise to mean "this parse failed" rather than "this processor is broken".
+_PROCESSOR_ERRORS = (ValueError, TypeError, KeyError, IndexError)
+
 # Result processing functions =====================================================================
 
 class ResultProcessors:
@@ -16,14 +39,29 @@ class ResultProcessors:
     def concat(rs):
         """Result processor: takes a list of results from multiple parsers and combines them into a single result.\n
         Converts results to strings and concatenates them."""
-        return ''.join(str(r) for r in rs)
+        # Results are nearly always strings already, and joining them as-is skips a str() call per result. join() only refuses them if
+        # something else is mixed in.
+        try:
+            return ''.join(rs)
+        except TypeError:
+            return ''.join(str(r) for r in rs)
 
     @staticmethod
     def take(*indexes):
         """Result processor generator: returns a result processor: ``func(results) -> result``\n
         Ignores all results except those at the given indexes. Result is a tuple, unless only one item is taken."""
+        indexes = sorted(set(i for i in indexes if i >= 0))
+        if not indexes:
+            return lambda rs: ()
+        # When every index is in range (the usual case), itemgetter picks the items out in one call: the item itself for a single index,
+        # a tuple for several.
+        getter = operator.itemgetter(*indexes)
+        last = indexes[-1]
         def fromProcTake(rs):
-            result = tuple(rs[i] for i in range(len(rs)) if i in indexes)
+            n = len(rs)
+            if n > last:
+                return getter(rs)
+            result = tuple(rs[i] for i in indexes if i < n)
             if len(result) == 1:
                 result = result[0]
             return result
@@ -44,199 +82,455 @@ class PrimitiveParsers:
     """Parsers that provide basic functions. The starting point to build more complex parsers along with combinators."""
 
     # Ultra-basic: decides to take a character based on a function on that character.
-    # Used for pretty much all the other primitive parsers.
+    # Meant for custom predicates; the primitives below test their character directly to save a function call per character.
     @staticmethod
     def byFunc(f):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that that will parse a single character from the input string according to the function provided. Provided function must
         consume a ``str`` and return a ``bool``."""
-        def fromByFunc(string):
-            c, rest = string[:1], string[1:]
+        def fromByFunc(string, pos):
+            c = string[pos:pos + 1]
             if f(c):
-                return c, rest
+                # c is empty at the end of the input, and then nothing is consumed.
+                return c, pos + len(c)
         return fromByFunc
 
     # Primitives
 
     @staticmethod
-    def digit(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
+    def digit(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
         Parses a single digit (0-9) from the input string."""
-        return PrimitiveParsers.byFunc(lambda c: c.isdigit())(string)
+        c = string[pos:pos + 1]
+        if c.isdigit():
+            return c, pos + 1
 
     @staticmethod
-    def letter(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
+    def letter(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
         Parses a single letter (a-z or A-Z) from the input string."""
-        return PrimitiveParsers.byFunc(lambda c: c.isalpha())(string)
+        c = string[pos:pos + 1]
+        if c.isalpha():
+            return c, pos + 1
 
     @staticmethod
-    def nonWhitespace(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
+    def nonWhitespace(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
         Parses a single non-whitespace character from the input string."""
-        return PrimitiveParsers.byFunc(lambda c: not c.isspace() and c != '')(string)
+        c = string[pos:pos + 1]
+        if not c.isspace() and c != '':
+            return c, pos + 1
 
     @staticmethod
-    def whitespace(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
+    def whitespace(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
         Parses a single whitespace character from the input string."""
-        return PrimitiveParsers.byFunc(lambda c: c.isspace())(string)
+        c = string[pos:pos + 1]
+        if c.isspace():
+            return c, pos + 1
 
     @staticmethod
     def char(c):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that that will parse one of the given character from the input string."""
-        return PrimitiveParsers.byFunc(lambda ic: ic == c)
+        n = len(c)
+        def fromChar(string, pos):
+            if string[pos:pos + 1] == c:
+                return c, pos + n
+        if n == 1:
+            fromChar._firstChars = frozenset(c)
+            fromChar._literal = c
+            fromChar._charRun = re.compile(re.escape(c) + '*')
+        return fromChar
 
     @staticmethod
     def notChar(c):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that that will parse any character except the given character from the input string."""
-        return PrimitiveParsers.byFunc(lambda ic: ic != c and ic != '')
+        def fromNotChar(string, pos):
+            ic = string[pos:pos + 1]
+            if ic != c and ic != '':
+                return ic, pos + 1
+        if len(c) == 1:
+            fromNotChar._charRun = re.compile('[^' + re.escape(c) + ']*')
+        return fromNotChar
 
     @staticmethod
     def take(n):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that that will parse `n` characters from the input string, whatever they are."""
-        def fromTake(string):
-            if len(string) >= n:
-                return string[:n], string[n:]
+        def fromTake(string, pos):
+            if len(string) - pos >= n:
+                return string[pos:pos + n], pos + n
         return fromTake
 
     @staticmethod
     def reg(pattern):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
-        Returns a parser that that will parse and return the match from the given regex expression. It will always consume and return all
-        characters involved in the match. It's hard to justify this as a \"primitive\" parser, but it's harder to justify it as a
-        \"prebuilt\" one."""
-        def fromReg(string):
-            m = re.match(pattern, string)
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Returns a parser that that will parse and return the match from the given regex expression, which may also be an already compiled
+        pattern. It will always consume and return all characters involved in the match. It's hard to justify this as a \"primitive\" parser, but it's harder to justify it as a
+        \"prebuilt\" one.\n
+        The pattern is matched in place, at the parser's position in the whole input, so it is already anchored there, and a leading ``^``
+        is dropped (unless the pattern uses ``re.MULTILINE``, where ``^`` also matches right after a newline). Any other ``^`` or ``\\A``
+        only matches at the very start of the input, and lookbehinds and ``\\b`` can see the text before the position."""
+        compiled = re.compile(pattern)
+        m = _RE_LEADING_CARET.match(compiled.pattern)
+        if m is not None and not compiled.flags & re.MULTILINE:
+            compiled = re.compile(m.group(1) + compiled.pattern[m.end():], compiled.flags)
+        def fromReg(string, pos):
+            m = compiled.match(string, pos)
             if m is not None:
-                return string[m.start():m.end()], string[m.end():]
+                return m.group(), m.end()
         return fromReg
 
+# Runs of characters each primitive is sure to accept, so many() can take them in a single regex match. \d only covers part of what
+# isdigit() accepts, and letter only has its ASCII run; many() carries on one character at a time after the run either way.
+PrimitiveParsers.digit._charRun = re.compile(r'\d*')
+PrimitiveParsers.letter._charRun = re.compile(r'[a-zA-Z]*')
+PrimitiveParsers.whitespace._charRun = re.compile(r'\s*')
+PrimitiveParsers.nonWhitespace._charRun = re.compile(r'\S*')
+
 # Combinators
 
+def _parse(parser, string, pos):
+    # Runs a whole parse with packrat memos of its own, which are dropped again as soon as it returns. A parse started from inside another
+    # (by a result processor, say) gets its own memos too, and the outer parse carries on with its own afterwards.
+    global _packratParse
+    outer = _packratParse
+    _packratParse = (string, {})
+    try:
+        return parser(string, pos)
+    finally:
+        _packratParse = outer
+
+def _inheritHints(parser, fromParser):
+    # Copies what fromParser knows about its first characters onto a parser that can only match where fromParser does.
+    for hint in ('_firstChars', '_literal'):
+        value = getattr(fromParser, hint, None)
+        if value is not None:
+            setattr(parser, hint, value)
+    return parser
+
+def _prefixFree(literals):
+    # True when no literal is the start of a different one, so at most one of them can match at any position.
+    return all(not b.startswith(a) or a == b for a in literals for b in literals)
+
+def _literalAlternation(parsers, literals):
+    # Tries parsers that each start with the matching (prefix free) literal. One regex finds the only literal that can match, and just
+    # the parsers starting with it are run.
+    byLiteral = {}
+    for p, literal in zip(parsers, literals):
+        byLiteral.setdefault(literal, []).append(p)
+    alternation = re.compile('|'.join(re.escape(literal) for literal in byLiteral))
+    def fromLiteralChoice(string, pos):
+        m = alternation.match(string, pos)
+        if m is not None:
+            for p in byLiteral[m.group()]:
+                pr = p(string, pos)
+                if pr is not None:
+                    return pr
+    fromLiteralChoice._firstChars = frozenset(literal[0] for literal in byLiteral)
+    return fromLiteralChoice
+
+@functools.lru_cache(maxsize=None)
+def _chainFactory(n):
+    # Generates, once per length, a function that builds chain parsers of n parsers with every step written out, so running a chain has
+    # no loop and no growing list of results.
+    names = [f'p{i}' for i in range(n)]
+    lines = [f"def makeChain(proc{''.join(', ' + name for name in names)}):", '    def fromChain(string, pos):']
+    for i, name in enumerate(names):
+        lines += [f'        pr = {name}(string, pos)', '        if pr is None: return None', f'        r{i}, pos = pr']
+    lines += [
+        f"        processed = proc([{', '.join(f'r{i}' for i in range(n))}])",
+        '        if processed is not None:',
+        '            return processed, pos',
+        '    return fromChain',
+    ]
+    namespace = {}
+    exec(compile('\n'.join(lines), f'<chain of {n}>', 'exec'), namespace)
+    return namespace['makeChain']
+
 class Combinators:
     @staticmethod
     def chain(*parsers, proc=ResultProcessors.concat):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
-        Returns a parser that attempts to runs a list of parsers one at a time, and only succeeds if all of them succeed."""
-        def fromChain(string):
-            results = ()
-            rest = string
-            for p in parsers:
-                pr = p(rest)
-                if pr is not None:
-                    result, rest = pr
-                    results += (result,)
-                else:
-                    return None
-            if len(results) == 0:
-                return None
-            return results, rest
-        return Combinators.after(fromChain, proc)
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Returns a parser that attempts to runs a list of parsers one at a time, and only succeeds if all of them succeed. The list of
+        results is passed to ``proc``, which can fail the parse by returning ``None``."""
+        fromChain = _chainFactory(len(parsers))(proc, *parsers)
+        parser = Combinators.packrat(fromChain) if _packratEnabled else fromChain
+        # A chain can only match where its first parser does.
+        return _inheritHints(parser, parsers[0]) if parsers else parser
 
     @staticmethod
     def chainIsw(*parsers, proc=ResultProcessors.concat):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Identical to ``chain()``, but wraps every parser with ``isw`` (ignore surrounding whitespace)."""
-        return Combinators.chain((PrebuiltParsers.isw(p) for p in parsers), proc)
+        return Combinators.chain(*(PrebuiltParsers.isw(p) for p in parsers), proc=proc)
 
     @staticmethod
     def many(parser, proc=ResultProcessors.concat):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that runs the same parser over and over until it fails, and returns all results. Fails if it can't parse at
-        least once."""
-        def fromMany(string):
-            results = ()
-            pr = parser(string)
+        least once. The list of results is passed to ``proc``, which can fail the parse by returning ``None``. A match that consumes
+        nothing ends the repetition, so repeating a parser that can succeed on empty input (like ``maybe``) cannot loop forever.\n
+        Repeating one of the single-character primitives (``digit``, ``letter``, ``whitespace``, ``nonWhitespace``, ``char`` or
+        ``notChar``) consumes the characters they are sure to accept with one regex match before going one character at a time."""
+        charRun = getattr(parser, '_charRun', None)
+        def fromMany(string, pos):
+            results = []
+            if charRun is not None:
+                end = charRun.match(string, pos).end()
+                results.extend(string[pos:end])
+                pos = end
+            pr = parser(string, pos)
             while pr is not None:
-                result, rest = pr
-                results += (result,)
-                pr = parser(rest)
-            if len(results) == 0:
+                result, end = pr
+                results.append(result)
+                if end == pos:
+                    break
+                pos = end
+                pr = parser(string, pos)
+            if not results:
                 return None
-            return results, rest
-        return Combinators.after(fromMany, proc)
+            processed = proc(results)
+            if processed is not None:
+                return processed, pos
+        return _inheritHints(Combinators.packrat(fromMany) if _packratEnabled else fromMany, parser)
 
     @staticmethod
     def manyOrNone(parser, proc=ResultProcessors.concat):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
-        Returns a parser that runs the same parser over and over until it fails, and returns all zero or more results."""
-        return Combinators.maybe(Combinators.many(parser, proc))
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Returns a parser that runs the same parser over and over until it fails, and returns all zero or more results. Behaves like
+        ``maybe(many(parser, proc))``: if nothing matches, or ``proc`` fails, the result is an empty string and no input is consumed. Runs
+        of single-character primitives are consumed with one regex match, as in ``many``."""
+        charRun = getattr(parser, '_charRun', None)
+        def fromManyOrNone(string, pos):
+            results = []
+            end = pos
+            if charRun is not None:
+                end = charRun.match(string, pos).end()
+                results.extend(string[pos:end])
+            pr = parser(string, end)
+            while pr is not None:
+                result, newEnd = pr
+                results.append(result)
+                if newEnd == end:
+                    break
+                end = newEnd
+                pr = parser(string, end)
+            if results:
+                processed = proc(results)
+                if processed is not None:
+                    return processed, end
+            return '', pos
+        return Combinators.packrat(fromManyOrNone) if _packratEnabled else fromManyOrNone
 
     @staticmethod
     def maybe(parser):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that runs one parser and never fails; if the given parser fails, this parser returns an empty string. Otherwise
         returns what the given parser would have."""
-        def fromMaybe(string):
-            pr = parser(string)
+        def fromMaybe(string, pos):
+            pr = parser(string, pos)
             if pr is None:
-                return '', string
+                return '', pos
             else:
                 return pr
         return fromMaybe
 
     @staticmethod
     def choice(*parsers):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that runs through a list of given parsers one at a time until one succeeds, and returns that result. Fails if
-        all given parsers fail."""
-        def fromChoice(string):
-            for p in parsers:
-                pr = p(string)
+        all given parsers fail.\n
+        Parsers that know which characters they can start with (such as ``char``, ``prefix``, ``quotedString``, or a ``chain``, ``many`` or
+        ``after`` of one) are skipped without being run when the next character of the input is not one of them. Parsers that start with a
+        literal (a ``prefix``, ``char``, or a chain beginning with one) are matched all at once with a single regex, as long as no literal
+        among neighbouring ones is the start of another."""
+        # choice(choice(a, b), c) tries the same parsers in the same order as choice(a, b, c), so nested choices are flattened.
+        parsers = tuple(q for p in parsers for q in getattr(p, '_alternatives', (p,)))
+        literals = [getattr(p, '_literal', None) for p in parsers]
+        if parsers and None not in literals and _prefixFree(literals):
+            fromChoice = _literalAlternation(parsers, literals)
+            unhinted = ()
+            table = fromChoice._firstChars
+        else:
+            # Neighbouring parsers that start with literals can still be matched together.
+            branches = []
+            for isLiteral, group in itertools.groupby(zip(parsers, literals), key=lambda pl: pl[1] is not None):
+                groupParsers, groupLiterals = zip(*group)
+                if isLiteral and len(groupParsers) > 1 and _prefixFree(groupLiterals):
+                    branches.append(_literalAlternation(groupParsers, groupLiterals))
+                else:
+                    branches.extend(groupParsers)
+            firstChars = [getattr(p, '_firstChars', None) for p in branches]
+            unhinted = tuple(p for p, fc in zip(branches, firstChars) if fc is None)
+            table = {}
+            for fc in firstChars:
+                for c in fc or ():
+                    table[c] = tuple(p for p, pfc in zip(branches, firstChars) if pfc is None or c in pfc)
+            def fromChoice(string, pos):
+                for p in table.get(string[pos:pos + 1], unhinted):
+                    pr = p(string, pos)
+                    if pr is not None:
+                        return pr
+        parser = Combinators.packrat(fromChoice) if _packratEnabled else fromChoice
+        parser._alternatives = parsers
+        if not unhinted:
+            parser._firstChars = frozenset(table)
+        return parser
+
+    @staticmethod
+    def adaptiveChoice(*parsers):
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Like ``choice``, but counts how often each given parser succeeds and moves frequent winners towards the front, so they are tried
+        first. Only use this when no two of the given parsers can match the same input: unlike ``choice``, the order the parsers are tried
+        in changes as parsing goes on. With ``enablePackrat()``, positions answered from the memo are not counted."""
+        order = list(parsers)
+        counts = dict.fromkeys(order, 0)
+        def fromAdaptiveChoice(string, pos):
+            # A parser can run this same choice again (in a recursive grammar) and reorder it, so the loop goes over a snapshot, wins are
+            # counted per parser rather than per place, and the winner's place is looked up again before it is moved.
+            for p in tuple(order):
+                pr = p(string, pos)
                 if pr is not None:
+                    counts[p] += 1
+                    i = order.index(p)
+                    if i > 0 and counts[p] > counts[order[i - 1]]:
+                        order[i - 1], order[i] = p, order[i - 1]
                     return pr
-        return fromChoice
+        return Combinators.packrat(fromAdaptiveChoice) if _packratEnabled else fromAdaptiveChoice
 
     @staticmethod
     def ignore(parser):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that runs the given parser, but then returns an empty string, no matter what the given parser did. This still consumes
         the input the given parser did."""
-        def fromIgnore(string):
-            pr = parser(string)
+        def fromIgnore(string, pos):
+            pr = parser(string, pos)
             if pr is None:
-                return '', string
+                return '', pos
             else:
                 return '', pr[1]
         return fromIgnore
 
     @staticmethod
     def after(parser, proc):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that runs a parser, and then runs the given result processor on the result. (NOTE: passed into the processor will
-        be a single object, not a list.) If either the input parser or the processor fail, this parser fails."""
-        def fromAfter(string):
-            pr = parser(string)
+        be a single object, not a list.) If either the input parser or the processor fail, this parser fails. A processor fails by returning
+        ``None``; exceptions it raises propagate (see ``afterSafe``)."""
+        def fromAfter(string, pos):
+            pr = parser(string, pos)
+            if pr is not None:
+                result, pos = pr
+                processed = proc(result)
+                if processed is None: return None
+                return processed, pos
+        return _inheritHints(Combinators.packrat(fromAfter) if _packratEnabled else fromAfter, parser)
+
+    @staticmethod
+    def afterSafe(parser, proc):
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Identical to ``after()``, but the processor may also fail by raising one of ``ValueError``, ``TypeError``, ``KeyError`` or
+        ``IndexError`` (as ``int()`` or indexing a result would). Useful for processors that can't easily check their input first."""
+        def fromAfterSafe(string, pos):
+            pr = parser(string, pos)
             if pr is not None:
-                result, rest = pr
+                result, pos = pr
                 try:
                     processed = proc(result)
-                    if processed is None: return None
-                    return processed, rest
-                except:
+                except _PROCESSOR_ERRORS:
                     return None
-        return fromAfter
+                if processed is None: return None
+                return processed, pos
+        return _inheritHints(Combinators.packrat(fromAfterSafe) if _packratEnabled else fromAfterSafe, parser)
+
+    @staticmethod
+    def span(parser):
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Returns a parser that runs the given parser, but returns the ``(start, end)`` positions of the input it consumed instead of its
+        result. Useful for keeping track of where things are in the input without building strings for them."""
+        def fromSpan(string, pos):
+            pr = parser(string, pos)
+            if pr is not None:
+                return (pos, pr[1]), pr[1]
+        return _inheritHints(fromSpan, parser)
+
+    @staticmethod
+    def matched(parser):
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Returns a parser that runs the given parser, but returns the exact input it consumed instead of its result. The text is sliced
+        from the input once, so the given parser can use ``ResultProcessors.doNothing`` rather than concatenating its pieces."""
+        def fromMatched(string, pos):
+            pr = parser(string, pos)
+            if pr is not None:
+                return string[pos:pr[1]], pr[1]
+        return _inheritHints(fromMatched, parser)
+
+    @staticmethod
+    def packrat(parser):
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Returns a parser that remembers what the given parser returned at every position of the input, so backtracking never runs it twice
+        at the same spot (packrat parsing). The memo belongs to one parse, and is dropped when that parse
+        returns: ``run()`` and ``conclude``d parsers start a parse, and so does calling a memoized parser directly (outside of one) or on a
+        different string than the parse it is in.
+        After ``enablePackrat()``, the parsers built by ``chain``, ``many``, ``manyOrNone``, ``choice``, ``adaptiveChoice``, ``after``,
+        ``afterSafe`` and ``PrebuiltParsers.isw`` are memoized this way automatically."""
+        def fromPackrat(string, pos):
+            parse = _packratParse
+            if parse is None or parse[0] is not string:
+                return _parse(fromPackrat, string, pos)
+            memos = parse[1]
+            memo = memos.get(fromPackrat)
+            if memo is None:
+                memo = memos[fromPackrat] = {}
+            if pos in memo:
+                return memo[pos]
+            pr = memo[pos] = parser(string, pos)
+            return pr
+        return fromPackrat
+
+    @staticmethod
+    def recursive(builder):
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Returns a parser for a grammar that contains itself. ``builder`` is called once with a parser that stands in for the finished
+        grammar, and returns the grammar built around it. This avoids writing the grammar as a function that builds every combinator again
+        each time it is called. For example, nested square brackets of letters::
+            Combinators.recursive(lambda brackets: Combinators.chain(
+                PrimitiveParsers.char('['),
+                Combinators.many(Combinators.choice(
+                    Combinators.many(PrimitiveParsers.letter),
+                    brackets
+                ), proc=lambda rs: list(rs)),
+                PrimitiveParsers.char(']'),
+
+                proc=lambda rs: rs[1]
+            ))\n
+        Each level of nesting still takes a few Python calls, so very deeply nested input can raise ``RecursionError``."""
+        grammar = None
+        def fromRecursive(string, pos):
+            return grammar(string, pos)
+        grammar = builder(fromRecursive)
+        return _inheritHints(fromRecursive, grammar)
 
     @staticmethod
     def whole(parser):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Parser generator: returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Returns a parser that fails if the given parser does not consume the entire input, but otherwise behaves the same as the input parser."""
-        def fromWhole(string):
-            result = parser(string)
-            if result is not None and result[1] == '':
+        def fromWhole(string, pos):
+            result = parser(string, pos)
+            if result is not None and result[1] == len(string):
                 return result
-        return fromWhole
+        return _inheritHints(fromWhole, parser)
 
     @staticmethod
     def conclude(parser):
-        """Parser generator: returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
-        Returns a parser that, uniquely, only returns the result and not the unconsumed input. Used for finishing a large, complex parser, so the end user only recieves the parsed object."""
-        def fromConclude(string):
-            pr = parser(string)
+        """Parser generator: returns parser as a function: ``func(string, pos=0) -> result or None``\n
+        Returns a parser that, uniquely, only returns the result and not the unconsumed input. Used for finishing a large, complex parser, so the end user only recieves the parsed object.
+        The position defaults to the start of the input, so the returned parser can be called with just a string."""
+        def fromConclude(string, pos=0):
+            pr = _parse(parser, string, pos)
             if pr is not None:
                 return pr[0]
         return fromConclude
@@ -247,35 +541,34 @@ class PrebuiltParsers:
     """Premade parsers composed of other parsers. These are provided for convenience, but also as examples of how to combine parsers together."""
 
     @staticmethod
-    def restOfLine(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
-        Consumes all input until and including a newline character, or EOF. This parser is composed as follows::
+    def restOfLine(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
+        Consumes all input until and including a newline character, or EOF. This parser behaves like the following, but matches the whole
+        line with a single regex::
             Combinators.chain(
                 Combinators.manyOrNone(PrimitiveParsers.notChar('\\n')),
                 Combinators.maybe(PrimitiveParsers.char('\\n'))
             )"""
-        return Combinators.chain(
-            Combinators.manyOrNone(PrimitiveParsers.notChar('\n')),
-            Combinators.maybe(PrimitiveParsers.char('\n'))
-        )(string)
+        m = _RE_LINE.match(string, pos)
+        return m.group(), m.end()
     
     @staticmethod
-    def restOfLineTrim(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
-        Consumes all input until a newline character, or EOF. If there is a newline rather than EOF, that newline is ignored. This parser is composed as follows::
+    def restOfLineTrim(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
+        Consumes all input until a newline character, or EOF. If there is a newline rather than EOF, that newline is ignored. This parser
+        behaves like the following, but matches the whole line with a single regex::
             Combinators.chain(
                 Combinators.manyOrNone(PrimitiveParsers.notChar('\\n')),
                 Combinators.ignore(PrimitiveParsers.char('\\n'))
             )"""
-        return Combinators.chain(
-            Combinators.manyOrNone(PrimitiveParsers.notChar('\n')),
-            Combinators.ignore(PrimitiveParsers.char('\n'))
-        )(string)
+        m = _RE_LINE.match(string, pos)
+        return m.group(1), m.end()
 
     @staticmethod
-    def quotedString(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
-        Consumes all input within two double quotes, ignoring escaped quotes. This parser is composed as follows::
+    def quotedString(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
+        Consumes all input within two double quotes, ignoring escaped quotes. This parser behaves like the following, but matches the whole
+        string with a single regex instead of running a parser per character::
             Combinators.chain(
                 PrimitiveParsers.char('"'),
                 Combinators.manyOrNone(Combinators.choice(
@@ -286,21 +579,15 @@ class PrebuiltParsers:
 
                 proc=lambda rs: rs[1].replace('\\\\"', '"')
             )"""
-        return Combinators.chain(
-            PrimitiveParsers.char('"'),
-            Combinators.manyOrNone(Combinators.choice(
-                PrebuiltParsers.prefix('\\"'),
-                PrimitiveParsers.notChar('"')
-            )),
-            PrimitiveParsers.char('"'),
-
-            proc=lambda rs: rs[1].replace('\\"', '"')
-        )(string)
+        m = _RE_QUOTED.match(string, pos)
+        if m is not None:
+            return m.group(1).replace('\\"', '"'), m.end()
 
     @staticmethod
-    def singleQuotedString(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
-        Consumes all input within two single quotes, ignoring escaped quotes. This parser is composed as follows::
+    def singleQuotedString(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
+        Consumes all input within two single quotes, ignoring escaped quotes. This parser behaves like the following, but matches the whole
+        string with a single regex instead of running a parser per character::
             Combinators.chain(
                 PrimitiveParsers.char('\\\''),
                 Combinators.manyOrNone(Combinators.choice(
@@ -311,22 +598,16 @@ class PrebuiltParsers:
 
                 proc=lambda rs: rs[1].replace('\\\\\\\', '\\\'')
             )"""
-        return Combinators.chain(
-            PrimitiveParsers.char('\''),
-            Combinators.manyOrNone(Combinators.choice(
-                PrebuiltParsers.prefix('\\\''),
-                PrimitiveParsers.notChar('\'')
-            )),
-            PrimitiveParsers.char('\''),
-
-            proc=lambda rs: rs[1].replace('\\\'', '\'')
-        )(string)
+        m = _RE_SINGLE_QUOTED.match(string, pos)
+        if m is not None:
+            return m.group(1).replace('\\\'', '\''), m.end()
 
     @staticmethod
     def isw(parser):
-        """Returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
+        """Returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
         Short for "ignore surrounding whitespace." Returns a parser that ignores all whitespace before and after the input parser, but only
-        returns the result of the input parser. This parser is composed as follows::
+        returns the result of the input parser. This parser behaves like the following, but skips the whitespace directly instead of going
+        through a chain::
             Combinators.chain(
                 PrebuiltParsers.allWhitespace,
                 parser,
@@ -334,70 +615,80 @@ class PrebuiltParsers:
                 
                 proc = ResultProcessors.take(1)
             )"""
-        return Combinators.chain(
-            PrebuiltParsers.allWhitespace,
-            parser,
-            PrebuiltParsers.allWhitespace,
-            
-            proc = ResultProcessors.take(1)
-        )
+        def fromIsw(string, pos):
+            pr = parser(string, _RE_WS.match(string, pos).end())
+            if pr is not None:
+                result, pos = pr
+                if result is not None:
+                    return result, _RE_WS.match(string, pos).end()
+        return Combinators.packrat(fromIsw) if _packratEnabled else fromIsw
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def prefix(pre):
-        """Returns parser as a function: ``func(string) -> tuple(result, rest) or None``\n
-        Returns a parser that consumes and returns the given prefix from the beginning of the input. This parser is composed as follows::
+        """Returns parser as a function: ``func(string, pos) -> tuple(result, pos) or None``\n
+        Returns a parser that consumes and returns the given prefix from the beginning of the input. This is the parser to use for any
+        literal string, and is also available as ``PrimitiveParsers.literal``. Parsers are cached, so asking for the same prefix twice
+        returns the same parser. This parser behaves like the following, but checks the whole prefix with a single
+        ``str.startswith``::
             Combinators.chain(
                 *tuple(PrimitiveParsers.char(c) for c in pre),
 
                 proc=ResultProcessors.concat
             )"""
-        def fromPrefix(string):
-            return Combinators.chain(
-                *tuple(PrimitiveParsers.char(c) for c in pre),
-
-                proc=ResultProcessors.concat
-            )(string)
+        n = len(pre)
+        def fromPrefix(string, pos):
+            if string.startswith(pre, pos):
+                return pre, pos + n
+        if pre:
+            fromPrefix._firstChars = frozenset(pre[0])
+            fromPrefix._literal = pre
         return fromPrefix
 
     @staticmethod
-    def token(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
-        Consumes and returns all non-whitespace characters from the beginning of the input. This parser is composed as follows::
+    def token(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
+        Consumes and returns all non-whitespace characters from the beginning of the input. This parser behaves like the following, but
+        scans the whole run with a single regex match::
             Combinators.many(
                 PrimitiveParsers.nonWhitespace
             )"""
-        return Combinators.many(PrimitiveParsers.nonWhitespace)(string)
+        m = _RE_NONWS.match(string, pos)
+        if m is not None:
+            return m.group(), m.end()
 
     @staticmethod
-    def allWhitespace(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
-        Parses as many whitespase characters as possbile. This parser is composed as follows::
+    def allWhitespace(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
+        Parses as many whitespase characters as possbile. This parser behaves like the following, but scans the whole run with a single
+        regex match::
             Combinators.manyOrNone(
                 PrimitiveParsers.whitespace
             )"""
-        return Combinators.manyOrNone(PrimitiveParsers.whitespace)(string)
+        m = _RE_WS.match(string, pos)
+        return m.group(), m.end()
 
     @staticmethod
-    def integer(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
-        Parses an integer. This parser is composed as follows::
+    def integer(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
+        Parses an integer. This parser behaves like the following, but matches the whole number with a single regex::
             Combinators.chain(
                 Combinators.maybe(PrimitiveParsers.char('-')),
                 Combinators.many(PrimitiveParsers.digit),
 
                 proc = lambda rs: int(''.join(rs))
             )"""
-        return Combinators.chain(
-            Combinators.maybe(PrimitiveParsers.char('-')),
-            Combinators.many(PrimitiveParsers.digit),
-
-            proc = lambda rs: int(''.join(rs))
-        )(string)
+        m = _RE_INTEGER.match(string, pos)
+        if m is not None:
+            end = m.end()
+            # \d only takes decimal digits, but PrimitiveParsers.digit takes anything isdigit() accepts (like '²'), which int() can't read.
+            if not string[end:end + 1].isdigit():
+                return int(m.group()), end
 
     @staticmethod
-    def decmial(string):
-        """Parser: takes a string as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the remaining unconsumed input.\n
-        Parses a decimal number (float). This parser is composed as follows::
+    def decmial(string, pos):
+        """Parser: takes a string and a position in it as an input and returns either ``None`` if the parser failed, or a tuple of the parsed output and the position of the remaining unconsumed input.\n
+        Parses a decimal number (float). This parser behaves like the following, but matches the whole number with a single regex::
             Combinators.chain(
                 Combinators.maybe(PrimitiveParsers.char('-')),
                 Combinators.many(PrimitiveParsers.digit),
@@ -408,20 +699,47 @@ class PrebuiltParsers:
 
                 proc = lambda rs: float(''.join(rs))
             )"""
-        return Combinators.chain(
-            Combinators.maybe(PrimitiveParsers.char('-')),
-            Combinators.many(PrimitiveParsers.digit),
-            Combinators.maybe(Combinators.chain(
-                PrimitiveParsers.char('.'),
-                Combinators.many(PrimitiveParsers.digit)
-            )),
-
-            proc = lambda rs: float(''.join(rs))
-        )(string)
+        m = _RE_DECIMAL.match(string, pos)
+        if m is not None:
+            end = m.end()
+            # As in integer(), a number running into a digit float() can't read fails, and so does one whose fraction starts with one.
+            following = string[end:end + 1]
+            if m.group(1) is None and following == '.':
+                following = string[end + 1:end + 2]
+            if not following.isdigit():
+                return float(m.group()), end
+
+# Both start with their quote, which lets choice() skip them on any other character.
+PrebuiltParsers.quotedString._firstChars = frozenset('"')
+PrebuiltParsers.quotedString._literal = '"'
+PrebuiltParsers.singleQuotedString._firstChars = frozenset('\'')
+PrebuiltParsers.singleQuotedString._literal = '\''
+
+# Matching a literal string is as basic as matching a character, so it is offered alongside char().
+PrimitiveParsers.literal = staticmethod(PrebuiltParsers.prefix)
+
+# Running parsers =================================================================================
+
+def run(parser, string):
+    """Runs a parser from the beginning of the input string and returns either ``None`` if the parser failed, or a tuple of the parsed
+    output and the remaining unconsumed input. Parsers only pass positions around internally; the rest of the input is sliced once, here."""
+    pr = _parse(parser, string, 0)
+    if pr is not None:
+        return pr[0], string[pr[1]:]
+
+def enablePackrat(enabled=True):
+    """Turns packrat parsing on (or off) for combinators. While it is on, every parser built by ``chain``, ``many``, ``manyOrNone``,
+    ``choice``, ``adaptiveChoice``, ``after``, ``afterSafe`` and ``PrebuiltParsers.isw`` is wrapped with ``Combinators.packrat``, which
+    makes backtracking-heavy grammars run in linear time at the cost of a memo lookup per call. It only affects parsers built after the
+    call, so call it before building your grammar.\n
+    An ``adaptiveChoice`` only counts the wins it actually runs, so within one parse a position answered from the memo does not move its
+    parsers around."""
+    global _packratEnabled
+    _packratEnabled = enabled
 
 if __name__ == '__main__':
     def apply(input, parser):
-        print(f'Input: \'{input}\' --> Output: {parser(input)}\n')
+        print(f'Input: \'{input}\' --> Output: {run(parser, input)}\n')
     
     usersRaw = '''User: (name = "Tony", age=26, desc=  "Some programmer idk")
     User: (name  ="Fred", desc   = "Some really awful \\"youtuber\\" who was popular a long time ago", age = -5)
@@ -475,16 +793,15 @@ if __name__ == '__main__':
     s = '-54.32 and a bit'
     apply(s, p)
 
-    def recParser(string):
-        return Combinators.chain(
-            PrimitiveParsers.char('['),
-            Combinators.many(Combinators.choice(
-                Combinators.many(PrimitiveParsers.letter),
-                recParser
-            ), proc=lambda rs: list(rs)),
-            PrimitiveParsers.char(']'),
+    recParser = Combinators.recursive(lambda recParser: Combinators.chain(
+        PrimitiveParsers.char('['),
+        Combinators.many(Combinators.choice(
+            Combinators.many(PrimitiveParsers.letter),
+            recParser
+        ), proc=lambda rs: list(rs)),
+        PrimitiveParsers.char(']'),
 
-            proc=lambda rs: rs[1]
-        )(string)
+        proc=lambda rs: rs[1]
+    ))
 
-    apply('[outer[innerA[innerB]innerA]outer]', Combinators.conclude(recParser))
+    apply('[outer[innerA[innerB]innerA]outer]', recParser)